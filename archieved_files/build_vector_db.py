@@ -69,9 +69,10 @@ def main():
         if len(ids_batch) >= BATCH_SIZE:
             # Embed the batch of texts
             embeddings = model.encode(vectors_batch, normalize_embeddings=True)
-            # Prepare point structures for Qdrant
+            # Prepare point structures for Qdrant (NumPy rows pass straight
+            # through; .tolist() would box 384 floats per vector)
             points = [
-                PointStruct(id=id_val, vector=emb.tolist(), payload=payload)
+                PointStruct(id=id_val, vector=emb, payload=payload)
                 for id_val, emb, payload in zip(ids_batch, embeddings, payloads_batch)
             ]
             # Upsert points into Qdrant
@@ -85,7 +86,7 @@ def main():
     if ids_batch:
         embeddings = model.encode(vectors_batch, normalize_embeddings=True)
         points = [
-            PointStruct(id=id_val, vector=emb.tolist(), payload=payload)
+            PointStruct(id=id_val, vector=emb, payload=payload)
             for id_val, emb, payload in zip(ids_batch, embeddings, payloads_batch)
         ]
         client.upsert(collection_name=COLLECTION_NAME, points=points)
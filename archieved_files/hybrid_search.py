@@ -1,13 +1,40 @@
-import json, os, string, numpy as np
-from sentence_transformers import SentenceTransformer
-from rank_bm25 import BM25Okapi
+import hashlib
+import json, os, sys, numpy as np
+from functools import lru_cache
+from pathlib import Path
+
+import bm25s
+import Stemmer
 from qdrant_client import QdrantClient, models
 
+# ort_encoder lives at the repo root, one level above this archived copy
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ort_encoder import load_encoder
+
+# Sparse BM25 query vectors enable fully server-side hybrid fusion when the
+# collection was built with the "bm25" named sparse vector
+try:
+    from fastembed import SparseTextEmbedding
+    sparse_model = SparseTextEmbedding("Qdrant/bm25")
+except ImportError:
+    sparse_model = None
+
+# Optional on-disk embedding cache so repeated queries survive restarts
+try:
+    import diskcache
+    _emb_disk_cache = diskcache.Cache(".emb_cache")
+except ImportError:
+    _emb_disk_cache = None
+
 # Paths (use the same as in build_vector_db.py)
 CHUNKS_PATH = "complaints_chunks.jsonl"
 DB_DIR = "qdrant_nhtsa_db"
+# Point at a Qdrant server (see start_qdrant.sh) to search over gRPC;
+# unset -> embedded single-process mode
+QDRANT_URL = os.getenv("QDRANT_URL", "")
 COLLECTION_NAME = "nhtsa_complaints"
 EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+BM25_INDEX_DIR = "bm25s_index"
 
 # 1. Load the complaints data to build a BM25 corpus
 docs = []      # full text of each complaint
@@ -26,24 +53,56 @@ with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
         docs.append(text)
         ids.append(doc_id)
 
-# Tokenize the documents for BM25
-def simple_tokenize(text):
-    """Lowercase and split text into tokens, removing punctuation."""
-    text = text.lower().translate(str.maketrans('', '', string.punctuation))
-    return text.split()
+# bm25s ships a numba-JIT scoring backend (~2x over the numpy one);
+# prefer it when numba is installed
+try:
+    import numba  # noqa: F401
+    BM25_BACKEND = "numba"
+except ImportError:
+    BM25_BACKEND = "numpy"
 
-tokenized_docs = [simple_tokenize(doc) for doc in docs]
-bm25 = BM25Okapi(tokenized_docs)  # build BM25 index in memory
-print(f"Built BM25 index for {len(docs)} documents.")
+# Load the persisted BM25 index when it exists - mmap keeps startup at
+# milliseconds since the sparse score arrays page in on demand - and only
+# tokenize + index the corpus on the first run.
+stemmer = Stemmer.Stemmer("english")
+if Path(BM25_INDEX_DIR).exists():
+    bm25 = bm25s.BM25.load(BM25_INDEX_DIR, mmap=True)
+    bm25.backend = BM25_BACKEND
+    print(f"Loaded BM25 index from {BM25_INDEX_DIR}.")
+else:
+    # Scores are precomputed into a SciPy CSR matrix, so scoring a query is
+    # a sparse row-sum instead of a Python loop over every document.
+    bm25 = bm25s.BM25(backend=BM25_BACKEND)
+    bm25.index(bm25s.tokenize(docs, stemmer=stemmer))
+    bm25.save(BM25_INDEX_DIR)  # persist so future runs can skip the rebuild
+    print(f"Built BM25 index for {len(docs)} documents.")
 
 # Create a mapping from ID to index in the docs list for quick lookup
 id_to_index = {doc_id: idx for idx, doc_id in enumerate(ids)}
 
-# Load the embedding model for query encoding
-model = SentenceTransformer(EMBED_MODEL_NAME)
+# Load the embedding model for query encoding (int8 ONNX on CPU when available)
+model = load_encoder(EMBED_MODEL_NAME)
+
+# Connect to Qdrant: server mode parallelizes searches and batches RPCs
+# server-side; the embedded client stays as the zero-setup fallback
+if QDRANT_URL:
+    client = QdrantClient(url=QDRANT_URL, prefer_grpc=True)
+else:
+    client = QdrantClient(path=DB_DIR)
 
-# Connect to Qdrant (embedded mode) to query vectors
-client = QdrantClient(path=DB_DIR)
+@lru_cache(maxsize=4096)
+def encode_query(query):
+    """Encode a query, memoized on normalized text so repeated queries
+    skip the transformer forward pass entirely."""
+    if _emb_disk_cache is not None:
+        key = hashlib.sha1((EMBED_MODEL_NAME + query).encode("utf-8")).hexdigest()
+        cached = _emb_disk_cache.get(key)
+        if cached is not None:
+            return cached
+    vec = model.encode(query, normalize_embeddings=True).tolist()
+    if _emb_disk_cache is not None:
+        _emb_disk_cache.set(key, vec)
+    return vec
 
 def hybrid_search(query, top_k=5, alpha=0.5):
     """
@@ -51,33 +110,58 @@ def hybrid_search(query, top_k=5, alpha=0.5):
     alpha = weight for BM25 vs vector (0.5 = equal weight).
     Returns a list of (id, score, metadata) for top_k results.
     """
-    # Encode query to vector
-    query_vec = model.encode(query, normalize_embeddings=True).tolist()
+    # Encode query to vector (cached on normalized text)
+    query_vec = encode_query(query.strip().lower())
 
-    # BM25: get scores for all docs and identify top candidates
-    query_tokens = simple_tokenize(query)
-    bm25_scores = bm25.get_scores(query_tokens)  # BM25 score for each doc
-    # Get top candidates from BM25
+    # BM25: retrieve the top-N docs directly from the sparse index
+    # (no dense score vector over the whole corpus, no argsort)
     bm25_top_n = 20  # consider top-N BM25 docs for combination
-    bm25_top_idxs = np.argsort(bm25_scores)[::-1][:bm25_top_n]
-    bm25_top_ids = {ids[i] for i in bm25_top_idxs}
-    max_bm25 = bm25_scores.max() if bm25_scores.max() > 0 else 1.0
-    min_bm25 = bm25_scores.min()
+    query_tokens = bm25s.tokenize(query, stemmer=stemmer)
+    top_idxs, top_scores = bm25.retrieve(query_tokens, k=min(bm25_top_n, len(docs)))
+    top_idxs, top_scores = top_idxs[0], top_scores[0]
+    bm25_score_by_id = {ids[i]: float(s) for i, s in zip(top_idxs, top_scores)}
+    bm25_top_ids = set(bm25_score_by_id)
+    max_bm25 = float(top_scores.max()) if top_scores.size and top_scores.max() > 0 else 1.0
     
-    # Vector search: get top vector-similar docs (with some limit)
+    # Vector search + BM25 payload lookup in a single batched RPC:
+    # the first request is the dense similarity search, the second fetches
+    # the BM25 top-N points (with payloads) via a HasIdCondition filter,
+    # so no per-id client.retrieve round-trips are needed later.
     vec_top_n = 20
-    search_result = client.query_points(
+    # Scan the 1-bit quantized vectors, then rescore the shortlist
+    # against the full-precision vectors (collection is binary-quantized)
+    quant_params = models.SearchParams(
+        quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+    )
+    dense_resp, bm25_resp = client.query_batch_points(
         collection_name=COLLECTION_NAME,
-        query=query_vec,
-        limit=vec_top_n,
-        with_payload=True
+        requests=[
+            models.QueryRequest(
+                query=query_vec,
+                using="dense",
+                limit=vec_top_n,
+                with_payload=True,
+                params=quant_params,
+            ),
+            models.QueryRequest(
+                query=query_vec,
+                using="dense",
+                filter=models.Filter(
+                    must=[models.HasIdCondition(has_id=list(bm25_top_ids))]
+                ),
+                limit=max(len(bm25_top_ids), 1),
+                with_payload=True,
+                params=quant_params,
+            ),
+        ],
     )
-    # Qdrant returns a list of ScoredPoint objects
+    # Qdrant returns a list of ScoredPoint objects per request
+    search_result = list(dense_resp.points) + list(bm25_resp.points)
     vector_top_ids = set()
     vector_scores = {}
     max_vec_score = 0.0
     min_vec_score = 0.0
-    for point in search_result:
+    for point in dense_resp.points:
         pid = point.id  # complaint ID
         vector_top_ids.add(pid)
         score = point.score  # higher = more similar (cosine similarity)
@@ -89,49 +173,74 @@ def hybrid_search(query, top_k=5, alpha=0.5):
             min_vec_score = score
 
     # Combine the candidates from both methods
-    candidate_ids = bm25_top_ids | vector_top_ids
+    candidate_ids = list(bm25_top_ids | vector_top_ids)
+
+    # One dict build instead of an O(N) scan of search_result per candidate
+    point_by_id = {p.id: p for p in search_result}
+
+    # Normalize BM25 and vector scores to [0,1] in one vectorized pass over
+    # the candidate arrays instead of per-element Python arithmetic.
+    # BM25 is anchored at zero - the corpus-wide minimum is ~0 - so the
+    # last retrieved hit keeps its real weight instead of mapping to 0.0
+    # (docs outside the BM25 top-N simply score 0 on the BM25 side)
+    raw_bm25 = np.array([bm25_score_by_id.get(pid, 0.0) for pid in candidate_ids], dtype=np.float32)
+    bm25_n = raw_bm25 / max_bm25
+
+    raw_vec = np.array([vector_scores.get(pid, 0.0) for pid in candidate_ids], dtype=np.float32)
+    if max_vec_score > min_vec_score:
+        in_vec = np.array([pid in vector_scores for pid in candidate_ids], dtype=bool)
+        vec_n = np.where(in_vec, (raw_vec - min_vec_score) / (max_vec_score - min_vec_score), 0.0)
+    else:
+        vec_n = raw_vec
+
+    # Hybrid weighted scores for all candidates at once
+    hybrid = alpha * bm25_n + (1 - alpha) * vec_n
 
     results = []
-    for pid in candidate_ids:
-        # Normalize BM25 and vector scores to [0,1] range
-        idx = id_to_index.get(pid)
-        bm25_score = 0.0
-        if idx is not None:
-            bm25_score = (bm25_scores[idx] - min_bm25) / (max_bm25 - min_bm25) if max_bm25 > min_bm25 else 0.0
-        vec_score = 0.0
-        if pid in vector_scores:
-            # Normalize vector score similarly (if min_vec_score is negative, handle accordingly)
-            if max_vec_score > min_vec_score:
-                vec_score = (vector_scores[pid] - min_vec_score) / (max_vec_score - min_vec_score)
-            else:
-                vec_score = vector_scores[pid]
-        # Hybrid weighted score
-        hybrid_score = alpha * bm25_score + (1 - alpha) * vec_score
-
-        # Get payload/metadata (if we have it from vector search or need to fetch)
-        meta = None
-        if pid in vector_scores:
-            # If came from vector search, payload is in search_result
-            # Find that point to get payload:
-            for point in search_result:
-                if point.id == pid:
-                    meta = point.payload
-                    break
-        if meta is None:
-            # If not from vector result, fetch payload from Qdrant by ID
-            res = client.retrieve(collection_name=COLLECTION_NAME, ids=[pid], with_payload=True)
-            if res:
-                meta = res[0].payload
-
-        results.append((pid, hybrid_score, meta or {}))
-    
+    for pid, hybrid_score in zip(candidate_ids, hybrid):
+        # Get payload/metadata: every candidate came back in the batched
+        # response (dense leg or BM25-id leg), so no extra fetch is needed
+        point = point_by_id.get(pid)
+        meta = point.payload if point is not None else None
+        results.append((pid, float(hybrid_score), meta or {}))
+
     # Sort candidates by hybrid score descending and return top_k
     results.sort(key=lambda x: x[1], reverse=True)
     return results[:top_k]
 
+def hybrid_search_server(query, top_k=5):
+    """
+    Hybrid search fused entirely server-side: Qdrant runs the sparse BM25
+    and dense legs via prefetch and merges them with RRF in a single RPC,
+    so no Python-side normalization or fusion runs at all.
+    Returns a list of (id, score, metadata) for top_k results.
+    """
+    query_vec = encode_query(query.strip().lower())
+    sparse = next(iter(sparse_model.embed([query])))
+    resp = client.query_points(
+        collection_name=COLLECTION_NAME,
+        prefetch=[
+            models.Prefetch(
+                query=models.SparseVector(
+                    indices=sparse.indices.tolist(), values=sparse.values.tolist()
+                ),
+                using="bm25",
+                limit=50,
+            ),
+            models.Prefetch(query=query_vec, using="dense", limit=50),
+        ],
+        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        limit=top_k,
+        with_payload=True,
+    )
+    return [(p.id, p.score, p.payload or {}) for p in resp.points]
+
 # Example usage:
 query = "2021 Tesla beam lighting issue"
-hits = hybrid_search(query, top_k=5, alpha=0.5)
+if sparse_model is not None:
+    hits = hybrid_search_server(query, top_k=5)
+else:
+    hits = hybrid_search(query, top_k=5, alpha=0.5)
 for pid, score, meta in hits:
     print(f"\nResult ID: {pid} | Hybrid Score: {score:.3f}")
     # Print some details from metadata
@@ -139,6 +248,9 @@ for pid, score, meta in hits:
         year = meta.get("vehicle_year")
         vehicle = meta.get("vehicle_raw")
         component = meta.get("component")
-        narrative = meta.get("full_text", "")[:200]  # first 200 chars of complaint
+        # Narratives are no longer duplicated in the payload; look them up
+        # in the corpus we already hold for BM25
+        idx = id_to_index.get(pid)
+        narrative = docs[idx][:200] if idx is not None else ""
         print(f"Vehicle: {year} {vehicle}, Component: {component}")
         print(f"Narrative snippet: {narrative}...")
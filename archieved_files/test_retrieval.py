@@ -11,14 +11,30 @@ Run:
 """
 
 import argparse
+import hashlib
 import json
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+# FAISS gives SIMD top-k selection; fall back to plain NumPy if missing
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# Optional on-disk embedding cache so repeated queries survive restarts
+try:
+    import diskcache
+
+    _emb_disk_cache = diskcache.Cache(".emb_cache")
+except ImportError:
+    _emb_disk_cache = None
+
 EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
 # Change this if your source JSONL filename differs
@@ -37,6 +53,21 @@ def read_jsonl(path: Path):
             yield json.loads(line)
 
 
+@lru_cache(maxsize=4096)
+def encode_query(model: SentenceTransformer, query: str) -> List[float]:
+    """Encode a query, memoized on normalized text so repeated queries
+    (in-process or across runs via diskcache) skip the model forward pass."""
+    if _emb_disk_cache is not None:
+        key = hashlib.sha1((EMBED_MODEL_NAME + query).encode("utf-8")).hexdigest()
+        cached = _emb_disk_cache.get(key)
+        if cached is not None:
+            return cached
+    vec = model.encode([query], normalize_embeddings=True).tolist()[0]
+    if _emb_disk_cache is not None:
+        _emb_disk_cache.set(key, vec)
+    return vec
+
+
 def detect_qdrant_dir() -> Optional[str]:
     for d in QDRANT_CANDIDATE_DIRS:
         if Path(d).exists():
@@ -47,16 +78,27 @@ def detect_qdrant_dir() -> Optional[str]:
 def try_qdrant_search(qdrant_dir: str, collection: str, query_vec: List[float], limit: int):
     try:
         from qdrant_client import QdrantClient
+        from qdrant_client.models import QuantizationSearchParams, SearchParams
     except Exception:
         return None
 
-    client = QdrantClient(path=qdrant_dir)
+    qdrant_url = os.getenv("QDRANT_URL", "")
+    if qdrant_url:
+        # server mode (see start_qdrant.sh): gRPC, supports concurrent search
+        client = QdrantClient(url=qdrant_url, prefer_grpc=True)
+    else:
+        client = QdrantClient(path=qdrant_dir)
     try:
         hits = client.query_points(
             collection_name=collection,
             query=query_vec,
+            using="dense",  # collection stores named dense + sparse vectors
             limit=limit,
             with_payload=True,
+            # collection is binary-quantized; rescore shortlist at full precision
+            search_params=SearchParams(
+                quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+            ),
         )
     except Exception as e:
         print(f"[warn] Qdrant query failed: {e}")
@@ -79,6 +121,14 @@ def try_qdrant_search(qdrant_dir: str, collection: str, query_vec: List[float],
     return results
 
 
+def doc_emb_cache_path(jsonl_path: Path) -> Path:
+    """Cache file for document embeddings, keyed on model + JSONL mtime."""
+    key = hashlib.sha1(
+        f"{EMBED_MODEL_NAME}:{jsonl_path.stat().st_mtime_ns}".encode("utf-8")
+    ).hexdigest()[:16]
+    return jsonl_path.with_name(f".emb_cache_{key}.npy")
+
+
 def fallback_vector_search_from_jsonl(jsonl_path: Path, model: SentenceTransformer, query: str, k: int):
     # Load docs (this is OK for 6,984 docs)
     docs = []
@@ -88,20 +138,45 @@ def fallback_vector_search_from_jsonl(jsonl_path: Path, model: SentenceTransform
         meta = obj.get("metadata", {}) or {}
         docs.append((doc_id, full_text, meta))
 
-    texts = [t for _, t, _ in docs]
-    emb = model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype("float32")
-    q = model.encode([query], normalize_embeddings=True, convert_to_numpy=True).astype("float32")[0]
-    scores = emb @ q
-    top_idx = np.argsort(scores)[::-1][:k]
+    # Encode once, then reuse the on-disk cache; mmap keeps RSS low on reload
+    cache_path = doc_emb_cache_path(jsonl_path)
+    if cache_path.exists():
+        emb = np.load(cache_path, mmap_mode="r")
+    else:
+        texts = [t for _, t, _ in docs]
+        emb = model.encode(
+            texts,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            batch_size=128,
+            show_progress_bar=False,
+        ).astype("float32")
+        np.save(cache_path, emb)
+
+    q = np.asarray(encode_query(model, query.strip().lower()), dtype="float32")
+
+    if faiss is not None:
+        # O(N log k) SIMD top-k instead of a full argsort over all scores
+        index = faiss.IndexFlatIP(emb.shape[1])
+        index.add(np.ascontiguousarray(emb))
+        sims, top_idx = index.search(q[None, :], k)
+        sims, top_idx = sims[0], top_idx[0]
+    else:
+        scores = emb @ q
+        # O(N) partition for the top-k, then sort only those k
+        kth = min(k, scores.size)
+        idx = np.argpartition(scores, -kth)[-kth:]
+        top_idx = idx[np.argsort(scores[idx])[::-1]]
+        sims = scores[top_idx]
 
     results = []
-    for rank, i in enumerate(top_idx, start=1):
+    for rank, (i, score) in enumerate(zip(top_idx, sims), start=1):
         doc_id, full_text, meta = docs[i]
         results.append(
             {
                 "rank": rank,
                 "id": doc_id,
-                "score": float(scores[i]),
+                "score": float(score),
                 "metadata": meta,
                 "full_text": full_text,
             }
@@ -152,11 +227,11 @@ def main():
     print("Loading embed model...")
     model = SentenceTransformer(EMBED_MODEL_NAME)
 
-    qvec = model.encode([args.query], normalize_embeddings=True).tolist()[0]
+    qvec = encode_query(model, args.query.strip().lower())
 
     qdrant_dir = detect_qdrant_dir()
-    if qdrant_dir:
-        print(f"Using Qdrant persistent DB at: {qdrant_dir}")
+    if os.getenv("QDRANT_URL") or qdrant_dir:
+        print(f"Using Qdrant at: {os.getenv('QDRANT_URL') or qdrant_dir}")
         results = try_qdrant_search(qdrant_dir, args.collection, qvec, args.k)
         if results is not None:
             print_results(results)
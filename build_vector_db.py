@@ -1,12 +1,33 @@
+import itertools
 import os
-import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, Any, Iterator, Tuple, Union, List
 
-from sentence_transformers import SentenceTransformer
+import orjson
+import torch
+
+from ort_encoder import load_encoder
 
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, VectorParams, Distance
+from qdrant_client.models import (
+    PointStruct,
+    VectorParams,
+    Distance,
+    OptimizersConfigDiff,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    SparseVector,
+    SparseVectorParams,
+)
+
+# Sparse BM25 doc vectors let Qdrant fuse the hybrid search server-side
+try:
+    from fastembed import SparseTextEmbedding
+
+    sparse_model = SparseTextEmbedding("Qdrant/bm25")
+except ImportError:
+    sparse_model = None
 
 
 # -----------------------------
@@ -14,20 +35,26 @@ from qdrant_client.models import PointStruct, VectorParams, Distance
 # -----------------------------
 INPUT_JSONL = "nhtsa_merged_complaints.jsonl"
 DB_DIR = "qdrant_nhtsa_db"
+# Point at a Qdrant server (see start_qdrant.sh) to ingest over gRPC;
+# unset -> embedded single-process mode
+QDRANT_URL = os.getenv("QDRANT_URL", "")
 COLLECTION_NAME = "nhtsa_complaints"
 
 EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-BATCH_SIZE = 256
+# MiniLM is small; a GPU only saturates with much larger batches
+BATCH_SIZE = 1024 if torch.cuda.is_available() else 256
 VECTOR_SIZE = 384  # MiniLM-L6-v2 output dimension
+UPLOAD_PARALLEL = 8  # concurrent upsert workers during bulk load
 
 
 def read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
-    with path.open("r", encoding="utf-8") as f:
+    # orjson parses straight from bytes (SIMD-accelerated C), so read binary
+    with path.open("rb") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
-            yield json.loads(line)
+            yield orjson.loads(line)
 
 
 def safe_point_id(raw_id: Any) -> Union[int, str]:
@@ -41,66 +68,125 @@ def safe_point_id(raw_id: Any) -> Union[int, str]:
         return str(raw_id)
 
 
+def iter_rows(in_path: Path) -> Iterator[Tuple[Union[int, str], str, Dict[str, Any]]]:
+    """Lazily yield (id, full_text, payload) per complaint line."""
+    for obj in read_jsonl(in_path):
+        doc_id = safe_point_id(obj.get("id"))
+        full_text = obj.get("full_text", "") or ""
+        meta = obj.get("metadata", {}) or {}
+
+        # meta is a fresh dict per parsed line, so annotate it in place
+        # instead of copying it into a new payload dict. The narrative is
+        # NOT stored again in the payload - the id points back into the
+        # source JSONL, which halves the on-disk payload footprint.
+        meta["id"] = str(obj.get("id"))
+        meta["source"] = "nhtsa_complaints"
+
+        yield doc_id, full_text, meta
+
+
+def iter_points(in_path: Path, model: Any) -> Iterator[PointStruct]:
+    """Encode in batches and yield points lazily for the parallel uploader.
+
+    A background worker encodes batch N+1 while the uploader drains
+    batch N, so encode time hides behind upsert I/O (and vice versa).
+    """
+    rows = iter_rows(in_path)
+
+    def encode_next():
+        batch = list(itertools.islice(rows, BATCH_SIZE))
+        if not batch:
+            return None
+        texts = [text for _, text, _ in batch]
+        with torch.inference_mode():
+            embeddings = model.encode(
+                texts,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                batch_size=BATCH_SIZE,
+                show_progress_bar=False,
+            )
+        if sparse_model is not None:
+            sparse_embs = list(sparse_model.embed(texts))
+        else:
+            sparse_embs = [None] * len(batch)
+        return batch, embeddings, sparse_embs
+
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        fut = ex.submit(encode_next)
+        while True:
+            result = fut.result()
+            if result is None:
+                return
+            # kick off the next encode before handing this batch out
+            fut = ex.submit(encode_next)
+            batch, embeddings, sparse_embs = result
+            # the client takes NumPy rows directly; .tolist() would box
+            # 384 Python floats per vector for nothing
+            for (pid, _, payload), vec, sp in zip(batch, embeddings, sparse_embs):
+                vector = {"dense": vec}
+                if sp is not None:
+                    vector["bm25"] = SparseVector(
+                        indices=sp.indices.tolist(), values=sp.values.tolist()
+                    )
+                yield PointStruct(id=pid, vector=vector, payload=payload)
+
+
 def main():
     in_path = Path(INPUT_JSONL)
     if not in_path.exists():
         raise SystemExit(f"❌ Input JSONL not found: {in_path.resolve()}")
 
     print("Loading embedding model...")
-    model = SentenceTransformer(EMBED_MODEL_NAME)
+    model = load_encoder(EMBED_MODEL_NAME)
 
-    print("Opening Qdrant persistent client...")
-    os.makedirs(DB_DIR, exist_ok=True)
-    client = QdrantClient(path=DB_DIR)
+    if QDRANT_URL:
+        print(f"Connecting to Qdrant server at {QDRANT_URL} (gRPC)...")
+        client = QdrantClient(url=QDRANT_URL, prefer_grpc=True)
+    else:
+        print("Opening Qdrant persistent client...")
+        os.makedirs(DB_DIR, exist_ok=True)
+        client = QdrantClient(path=DB_DIR)
 
     print(f"Creating/recreating collection: {COLLECTION_NAME}")
-    # recreate_collection wipes old collection for clean rebuild
+    # recreate_collection wipes old collection for clean rebuild;
+    # indexing_threshold=0 defers HNSW building until the bulk load is done.
+    # Full FP32 vectors live on disk; the search scan runs over 1-bit
+    # quantized vectors kept in RAM (32x fewer bytes) and queries rescore
+    # the shortlist against the originals. If recall ever suffers, swap in
+    # ScalarQuantization(type=ScalarType.INT8) as the gentler option.
     client.recreate_collection(
         collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
+        vectors_config={
+            "dense": VectorParams(
+                size=VECTOR_SIZE, distance=Distance.COSINE, on_disk=True
+            )
+        },
+        sparse_vectors_config={"bm25": SparseVectorParams()},
+        quantization_config=BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=True)
+        ),
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=0),
+        on_disk_payload=True,
     )
 
-    batch_ids: List[Union[int, str]] = []
-    batch_texts: List[str] = []
-    batch_payloads: List[Dict[str, Any]] = []
-    total = 0
-
-    for obj in read_jsonl(in_path):
-        doc_id = safe_point_id(obj.get("id"))
-        full_text = obj.get("full_text", "") or ""
-        meta = obj.get("metadata", {}) or {}
+    print(f"Uploading with {UPLOAD_PARALLEL} parallel workers...")
+    # upload_points consumes the generator lazily, so encoding the next
+    # batch overlaps with the worker pool upserting the previous ones
+    client.upload_points(
+        collection_name=COLLECTION_NAME,
+        points=iter_points(in_path, model),
+        batch_size=BATCH_SIZE,
+        parallel=UPLOAD_PARALLEL,
+        wait=True,
+    )
 
-        # Store metadata + full complaint text in payload
-        payload = dict(meta)
-        payload["id"] = str(obj.get("id"))
-        payload["full_text"] = full_text
-        payload["source"] = "nhtsa_complaints"
-
-        batch_ids.append(doc_id)
-        batch_texts.append(full_text)
-        batch_payloads.append(payload)
-
-        if len(batch_ids) >= BATCH_SIZE:
-            embeddings = model.encode(batch_texts, normalize_embeddings=True).tolist()
-            points = [
-                PointStruct(id=pid, vector=vec, payload=pl)
-                for pid, vec, pl in zip(batch_ids, embeddings, batch_payloads)
-            ]
-            client.upsert(collection_name=COLLECTION_NAME, points=points)
-            total += len(points)
-            print(f"Upserted {total} complaints...")
-
-            batch_ids, batch_texts, batch_payloads = [], [], []
-
-    # final flush
-    if batch_ids:
-        embeddings = model.encode(batch_texts, normalize_embeddings=True).tolist()
-        points = [
-            PointStruct(id=pid, vector=vec, payload=pl)
-            for pid, vec, pl in zip(batch_ids, embeddings, batch_payloads)
-        ]
-        client.upsert(collection_name=COLLECTION_NAME, points=points)
-        total += len(points)
+    # Re-enable indexing now that all points are in
+    client.update_collection(
+        collection_name=COLLECTION_NAME,
+        optimizer_config=OptimizersConfigDiff(indexing_threshold=20000),
+    )
+    total = client.count(collection_name=COLLECTION_NAME).count
 
     print("\n✅ Done.")
     print(f"Total complaints stored: {total}")
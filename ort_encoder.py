@@ -0,0 +1,87 @@
+"""Shared embedding encoder with an int8 ONNX Runtime fast path.
+
+On CPU the MiniLM forward pass dominates both ingest and query latency.
+optimum can export the model to ONNX and quantize its weights to int8,
+which roughly doubles throughput on AVX-512 (VNNI) CPUs. When a GPU is
+present the FP16 PyTorch model wins and is returned directly; when the
+optimum/onnxruntime stack is not installed we fall back to the regular
+SentenceTransformer model.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+ONNX_INT8_DIR = "miniLM-int8"
+
+
+class OrtEncoder:
+    """Thin wrapper exposing SentenceTransformer's encode() signature."""
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=32,
+               convert_to_numpy=True, show_progress_bar=False):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        chunks = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer(
+                texts[i:i + batch_size],
+                padding=True,
+                truncation=True,
+                return_tensors="np",
+            )
+            hidden = self.model(**enc).last_hidden_state
+            # mean pooling over non-padding tokens, as MiniLM expects
+            mask = enc["attention_mask"][:, :, None].astype(hidden.dtype)
+            emb = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                emb = emb / np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+            chunks.append(emb.astype(np.float32))
+        emb = np.concatenate(chunks, axis=0)
+        return emb[0] if single else emb
+
+
+def load_encoder(model_name):
+    """Return the fastest available encoder for this machine.
+
+    CUDA -> FP16 SentenceTransformer; CPU with optimum installed -> int8
+    ONNX Runtime export (built and cached on first use); otherwise the
+    plain PyTorch model, with BetterTransformer kernels if available.
+    """
+    if torch.cuda.is_available():
+        model = SentenceTransformer(model_name, device="cuda")
+        model.half()  # FP16 halves memory traffic and doubles ALU throughput
+        return model
+
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+    except ImportError:
+        model = SentenceTransformer(model_name)
+        try:
+            # fused attention kernels on CPU via optimum, if installed
+            model[0].auto_model = model[0].auto_model.to_bettertransformer()
+        except Exception:
+            pass
+        return model
+
+    onnx_dir = Path(ONNX_INT8_DIR)
+    if not onnx_dir.exists():
+        ort_model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        quantizer = ORTQuantizer.from_pretrained(ort_model)
+        quantizer.quantize(
+            save_dir=str(onnx_dir),
+            quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False),
+        )
+    return OrtEncoder(
+        ORTModelForFeatureExtraction.from_pretrained(str(onnx_dir)),
+        AutoTokenizer.from_pretrained(str(onnx_dir)),
+    )
@@ -11,6 +11,16 @@ load_dotenv()
 YEAR = os.getenv("YEAR")
 YEARS = ast.literal_eval(YEAR)
 
+# Precompiled patterns: these run once per panel/page in the hot loop,
+# so compile them a single time at import instead of on every call
+FOR_PREFIX_RE = re.compile(r'^\s*for\s+', re.IGNORECASE)
+YEAR_VEHICLE_RE = re.compile(r'(\d{4})\s+(.+)')
+COMPONENT_PREFIX_RE = re.compile(r'^\s*Components?:\s+', re.IGNORECASE)
+STATS_PREFIX_RE = re.compile(r'CrashNo\s*FireNo\s*Injuries\d+\s*Deaths\d+', re.IGNORECASE)
+AFFECTED_SUFFIX_RE = re.compile(r'\d+\s+Affected Product.*$', re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'\s+')
+
+
 def push_data_to_airtable(nhtsa_data, year):
     print(f"Ready to push {len(nhtsa_data)} records for {year} to Airtable.")
 
@@ -23,18 +33,51 @@ def save_partial_results(year, complaints):
 
 
 
+# Walks every complaint panel inside the browser and returns plain dicts,
+# so the whole page costs one CDP round-trip instead of dozens per panel.
+PANELS_JS = """
+() => Array.from(document.querySelectorAll('.panel-item')).map(panel => {
+    const text = el => el ? el.innerText : '';
+    const body = panel.querySelector('.panel-body');
+    const field = label => {
+        if (!body) return '';
+        const p = Array.from(body.querySelectorAll('p')).find(el => el.innerText.includes(label));
+        const span = p ? p.querySelector('span') : null;
+        return span ? span.innerText : '';
+    };
+    const summaryLabel = body ? body.querySelector('p.vehicle-detail--issue-summary') : null;
+    const stats = [];
+    if (body) {
+        for (const stat of body.querySelectorAll('.vehicle-details--complaints-sidebar p')) {
+            const spans = stat.querySelectorAll('span');
+            if (spans.length === 2) stats.push([spans[0].innerText, spans[1].innerText]);
+        }
+    }
+    return {
+        titleText: text(panel.querySelector('div.panel-title div')),
+        componentText: text(panel.querySelector('span.panel-title-caption')),
+        incidentDate: field('Incident Date'),
+        consumerLocation: field('Consumer Location'),
+        vin: field('Vehicle Identification Number'),
+        summary: summaryLabel && summaryLabel.nextElementSibling ? summaryLabel.nextElementSibling.innerText : '',
+        stats: stats,
+    };
+})
+"""
+
+
 def clean_summary(text):
     if not text:
         return ""
 
     # Remove known prefix patterns
-    text = re.sub(r'CrashNo\s*FireNo\s*Injuries\d+\s*Deaths\d+', '', text, flags=re.IGNORECASE)
+    text = STATS_PREFIX_RE.sub('', text)
 
     # Remove trailing junk like "1 Affected Product"
-    text = re.sub(r'\d+\s+Affected Product.*$', '', text, flags=re.IGNORECASE)
+    text = AFFECTED_SUFFIX_RE.sub('', text)
 
     # Normalize whitespace and newlines
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = WHITESPACE_RE.sub(' ', text).strip()
 
     return text
 
@@ -46,8 +89,8 @@ async def extract_complaints_data(page):
         small_element = await page.query_selector("section#complaints h1 > small")
         if small_element:
             small_text = await small_element.inner_text()
-            clean_text = re.sub(r'^\s*for\s+', '', small_text, flags=re.IGNORECASE).strip()
-            match = re.match(r"(\d{4})\s+(.+)", clean_text)
+            clean_text = FOR_PREFIX_RE.sub('', small_text).strip()
+            match = YEAR_VEHICLE_RE.match(clean_text)
             if match:
                 extracted_year = match.group(1)
                 vehicle_name = match.group(2).strip()
@@ -62,70 +105,40 @@ async def extract_complaints_data(page):
         extracted_year = ""
         vehicle_name = ""
 
-    complaint_panels = await page.query_selector_all('.panel-item')
+    # One in-page evaluate pulls every panel's raw text; parsing stays in Python
+    raw_panels = await page.evaluate(PANELS_JS)
     complaints = []
 
-    for panel in complaint_panels:
+    for raw in raw_panels:
         data = {
             "year": extracted_year,
             "vehicle": vehicle_name
         }
         try:
-            date_div = await panel.query_selector('div.panel-title div')
-            date_text = await date_div.inner_text()
-            if 'NHTSA ID NUMBER:' in date_text:
-                parts = date_text.split('NHTSA ID NUMBER:')
-                data['reportedDate'] = parts[0].strip()
-                data['nhtsaId'] = parts[1].strip()
+            head, sep, tail = raw['titleText'].partition('NHTSA ID NUMBER:')
+            if sep:
+                data['reportedDate'] = head.strip()
+                data['nhtsaId'] = tail.strip()
             else:
                 data['reportedDate'] = ''
                 data['nhtsaId'] = ''
 
-            component_div = await panel.query_selector('span.panel-title-caption')
-            if component_div:
-                component_text = await component_div.inner_text()
-                data['component'] = re.sub(r'^\s*Components?:\s+', '', component_text, flags=re.IGNORECASE).strip()
-            else:
-                data['component'] = ''
-
-            body = await panel.query_selector('.panel-body')
-
-            async def extract_field(label):
-                p = body and await body.query_selector(f"p:has-text('{label}')")
-                if p:
-                    span = await p.query_selector('span')
-                    return await span.inner_text() if span else ''
-                return ''
-
-            data['IncidentDate'] = await extract_field("Incident Date")
-            data['consumerLocation'] = await extract_field("Consumer Location")
-            data['vin'] = await extract_field("Vehicle Identification Number")
+            data['component'] = COMPONENT_PREFIX_RE.sub('', raw['componentText']).strip()
 
-            summary = await body.query_selector('p.vehicle-detail--issue-summary')
-            if summary:
-                summary_p = await summary.evaluate_handle("el => el.nextElementSibling")
-                raw_summary = await summary_p.inner_text() if summary_p else ''
-                data['summary'] = clean_summary(raw_summary)
+            data['IncidentDate'] = raw['incidentDate']
+            data['consumerLocation'] = raw['consumerLocation']
+            data['vin'] = raw['vin']
+            data['summary'] = clean_summary(raw['summary'])
 
-            else:
-                data['summary'] = ''
-
-            stats_col = await body.query_selector('.vehicle-details--complaints-sidebar')
-            if stats_col:
-                stats = await stats_col.query_selector_all('p')
-                for stat in stats:
-                    spans = await stat.query_selector_all('span')
-                    if len(spans) == 2:
-                        key = await spans[0].inner_text()
-                        val = await spans[1].inner_text()
-                        if key.lower() == 'crash':
-                            data['crash'] = val
-                        elif key.lower() == 'fire':
-                            data['fire'] = val
-                        elif 'injuries' in key.lower():
-                            data['injuries'] = val
-                        elif 'deaths' in key.lower():
-                            data['deaths'] = val
+            for key, val in raw['stats']:
+                if key.lower() == 'crash':
+                    data['crash'] = val
+                elif key.lower() == 'fire':
+                    data['fire'] = val
+                elif 'injuries' in key.lower():
+                    data['injuries'] = val
+                elif 'deaths' in key.lower():
+                    data['deaths'] = val
 
             complaints.append(data)
 
@@ -236,14 +249,23 @@ async def scrape_year(year, context):
 
 async def scrape_all_years():
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False, slow_mo=200)
+        browser = await p.chromium.launch(headless=True)
         context = await browser.new_context()
 
-        for year in YEARS:
-            try:
+        # Years are independent, so scrape them concurrently; the semaphore
+        # caps how many tabs are open at once
+        sem = asyncio.Semaphore(4)
+
+        async def bounded_scrape(year):
+            async with sem:
                 await scrape_year(year, context)
-            except Exception as e:
-                print(f"Error scraping {year}:", e)
+
+        results = await asyncio.gather(
+            *(bounded_scrape(year) for year in YEARS), return_exceptions=True
+        )
+        for year, result in zip(YEARS, results):
+            if isinstance(result, Exception):
+                print(f"Error scraping {year}:", result)
 
         await browser.close()
 
@@ -60,10 +60,10 @@ async def extract_complaints_data(page):
         try:
             date_div = await panel.query_selector('div.panel-title div')
             date_text = await date_div.inner_text()
-            if 'NHTSA ID NUMBER:' in date_text:
-                parts = date_text.split('NHTSA ID NUMBER:')
-                data['reportedDate'] = parts[0].strip()
-                data['nhtsaId'] = parts[1].strip()
+            head, sep, tail = date_text.partition('NHTSA ID NUMBER:')
+            if sep:
+                data['reportedDate'] = head.strip()
+                data['nhtsaId'] = tail.strip()
             else:
                 data['reportedDate'] = ''
                 data['nhtsaId'] = ''
@@ -100,20 +100,21 @@ async def extract_complaints_data(page):
 
             stats_col = await body.query_selector('.vehicle-details--complaints-sidebar')
             if stats_col:
-                stats = await stats_col.query_selector_all('p')
-                for stat in stats:
-                    spans = await stat.query_selector_all('span')
-                    if len(spans) == 2:
-                        key = await spans[0].inner_text()
-                        val = await spans[1].inner_text()
-                        if key.lower() == 'crash':
-                            data['crash'] = val
-                        elif key.lower() == 'fire':
-                            data['fire'] = val
-                        elif 'injuries' in key.lower():
-                            data['injuries'] = val
-                        elif 'deaths' in key.lower():
-                            data['deaths'] = val
+                # batched read: one protocol call returns every span text as
+                # [key1, val1, key2, val2, ...] instead of 3 awaits per stat
+                texts = await stats_col.eval_on_selector_all(
+                    'p span', 'els => els.map(el => el.innerText)'
+                )
+                for i in range(0, len(texts) - 1, 2):
+                    key, val = texts[i], texts[i + 1]
+                    if key.lower() == 'crash':
+                        data['crash'] = val
+                    elif key.lower() == 'fire':
+                        data['fire'] = val
+                    elif 'injuries' in key.lower():
+                        data['injuries'] = val
+                    elif 'deaths' in key.lower():
+                        data['deaths'] = val
 
             complaints.append(data)
 
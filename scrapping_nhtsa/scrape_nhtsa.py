@@ -1,161 +1,447 @@
 import asyncio
+import logging
+import logging.handlers
+import queue
+import httpx
+import orjson
 from playwright.async_api import async_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from dotenv import load_dotenv
 import os
-import json
+from typing import Final
+
+# Lexbor-backed HTML parser: one page.content() call plus a C-level DOM
+# walk beats per-panel CDP queries; fall back to in-page evaluate if absent
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+# Log through a queue so a slow stderr write never blocks the event loop;
+# the QueueListener drains it on a background thread
+logger = logging.getLogger(__name__)
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.setLevel(logging.INFO)
+_log_listener.start()
 
 # Load environment variables
 load_dotenv()
 YEAR = os.getenv("YEAR")
 
+# The complaint data rendered at nhtsa.gov is also served as plain JSON by
+# api.nhtsa.gov - no JavaScript execution needed. The API path is the
+# default; set USE_BROWSER=1 to fall back to the Playwright flow.
+USE_BROWSER = os.getenv("USE_BROWSER", "0") == "1"
+NHTSA_API = "https://api.nhtsa.gov"
+
+# Tunables, overridable from the environment so a run like
+# CONCURRENCY=16 python scrape_nhtsa.py needs no code edit. Module-level
+# Final ints also spare the hot loops per-iteration frame lookups.
+MAX_COMPLAINTS: Final[int] = int(os.getenv("MAX_COMPLAINTS", "20"))
+CONCURRENCY: Final[int] = int(os.getenv("CONCURRENCY", "8"))
+HEADLESS: Final[bool] = os.getenv("HEADLESS", "1") == "1"
+NAV_TIMEOUT_MS: Final[int] = int(os.getenv("NAV_TIMEOUT_MS", "10000"))
+
+# Selector constants hoisted to module scope so the selector engine parses
+# each of them once instead of on every call site in the hot loops
+PANEL_GROUP_SEL = ".vehicle-issues.panel-group"
+RESULTS_ROW_SEL = "table tbody tr"
+ROW_SEL = "table > tbody > tr"
+ROW_LINKS_SEL = "td a"
+
+# O(1) stat-key dispatch instead of a lowercased elif chain per stat
+STAT_MAP = {"crash": "crash", "fire": "fire", "injuries": "injuries", "deaths": "deaths"}
+
+# The extractor only reads text out of the DOM; none of these resource
+# types contribute to it, so don't spend bandwidth or layout time on them
+# (document/script/xhr/fetch stay - the panels render via JS)
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet", "other"}
+
+# Checks the "next" button and clicks it in one in-page call: one CDP
+# roundtrip instead of the count/is_enabled/click trio
+NEXT_CLICK_JS = """
+() => {
+    const b = Array.from(document.querySelectorAll('button.link-arrow'))
+        .find(el => el.innerText.trim().toLowerCase().includes('next'));
+    if (!b || b.disabled) return false;
+    b.click();
+    return true;
+}
+"""
+
+# Reads the highest page number out of the pagination footer (1 if absent)
+PAGE_COUNT_JS = """
+() => {
+    const nums = Array.from(document.querySelectorAll('.pagination a, .pagination button'))
+        .map(el => parseInt(el.innerText.trim(), 10))
+        .filter(n => !isNaN(n));
+    return nums.length ? Math.max(...nums) : 1;
+}
+"""
+
+# Walks every complaint panel inside the browser and returns plain dicts,
+# so a whole page of panels costs one CDP round-trip instead of ~10 each
+PANELS_JS = """
+() => Array.from(document.querySelectorAll('.panel-item')).map(panel => {
+    const text = el => el ? el.innerText : '';
+    const body = panel.querySelector('.panel-body');
+    const field = label => {
+        if (!body) return '';
+        const p = Array.from(body.querySelectorAll('p')).find(el => el.innerText.includes(label));
+        const span = p ? p.querySelector('span') : null;
+        return span ? span.innerText : '';
+    };
+    const summaryLabel = body ? body.querySelector('p.vehicle-detail--issue-summary') : null;
+    const stats = [];
+    if (body) {
+        for (const stat of body.querySelectorAll('.vehicle-details--complaints-sidebar p')) {
+            const spans = stat.querySelectorAll('span');
+            if (spans.length === 2) stats.push([spans[0].innerText, spans[1].innerText]);
+        }
+    }
+    return {
+        titleText: text(panel.querySelector('div.panel-title div')),
+        consumerLocation: field('Consumer Location'),
+        vin: field('Vehicle Identification Number'),
+        summary: summaryLabel && summaryLabel.nextElementSibling ? summaryLabel.nextElementSibling.innerText : '',
+        stats: stats,
+    };
+})
+"""
+
+
+def _panels_from_html(html):
+    """Pure-Python mirror of PANELS_JS over the serialized page HTML,
+    returning the same raw dicts the in-page evaluate produces."""
+    panels = []
+    for panel in HTMLParser(html).css('.panel-item'):
+        body = panel.css_first('.panel-body')
+
+        def field(label):
+            if body is None:
+                return ''
+            for p in body.css('p'):
+                if label in (p.text() or ''):
+                    span = p.css_first('span')
+                    return span.text() if span else ''
+            return ''
+
+        title = panel.css_first('div.panel-title div')
+
+        summary = ''
+        summary_label = body.css_first('p.vehicle-detail--issue-summary') if body else None
+        if summary_label is not None:
+            sibling = summary_label.next
+            while sibling is not None and sibling.tag == '-text':
+                sibling = sibling.next
+            if sibling is not None:
+                summary = sibling.text()
+
+        stats = []
+        if body is not None:
+            for stat in body.css('.vehicle-details--complaints-sidebar p'):
+                spans = stat.css('span')
+                if len(spans) == 2:
+                    stats.append([spans[0].text(), spans[1].text()])
+
+        panels.append({
+            'titleText': title.text() if title else '',
+            'consumerLocation': field('Consumer Location'),
+            'vin': field('Vehicle Identification Number'),
+            'summary': summary,
+            'stats': stats,
+        })
+    return panels
+
+
 async def extract_complaints_data(page, max_to_collect, collected_so_far):
-    complaints = []
+    # Quota is fixed for the whole call, so compute it once instead of
+    # re-deriving len(complaints) + collected_so_far on every panel
+    remaining = max_to_collect - collected_so_far
+    if remaining <= 0:
+        return []
+    # Pre-sized result slab plus a cursor: no list growth and no repeated
+    # append-method lookups in the per-panel loop
+    complaints = [None] * remaining
+    idx = 0
 
     while True:
-        await page.wait_for_selector('.vehicle-issues.panel-group')
-        complaint_panels = await page.query_selector_all('.panel-item')
-
-        for panel in complaint_panels:
-            if len(complaints) + collected_so_far >= max_to_collect:
-                return complaints
+        try:
+            # pages with no complaints are common - give up after 3 s
+            # instead of the default 30 s
+            await page.wait_for_selector(PANEL_GROUP_SEL, timeout=3000)
+        except PlaywrightTimeoutError:
+            return complaints[:idx]
+        # Playwright only navigates; extraction runs over the serialized
+        # HTML in C when selectolax is installed, else one in-page evaluate
+        if HTMLParser is not None:
+            raw_panels = _panels_from_html(await page.content())
+        else:
+            raw_panels = await page.evaluate(PANELS_JS)
 
+        # Bound the loop itself: panels past the quota are never parsed
+        for raw in raw_panels[:remaining - idx]:
             data = {}
 
             try:
                 # Top Section: Date + NHTSA ID
-                date_div = await panel.query_selector('div.panel-title div')
-                date_text = await date_div.inner_text()
-                if 'NHTSA ID NUMBER:' in date_text:
-                    parts = date_text.split('NHTSA ID NUMBER:')
-                    data['incidentDate'] = parts[0].strip()
-                    data['nhtsaId'] = parts[1].strip()
+                # partition stops at the first match and returns a fixed
+                # 3-tuple - no list allocation per panel
+                head, sep, tail = raw['titleText'].partition('NHTSA ID NUMBER:')
+                if sep:
+                    data['incidentDate'] = head.strip()
+                    data['nhtsaId'] = tail.strip()
                 else:
                     data['incidentDate'] = ''
                     data['nhtsaId'] = ''
 
-                # Body Section
-                body = await panel.query_selector('.panel-body')
+                data['consumerLocation'] = raw['consumerLocation']
+                data['vin'] = raw['vin']
+                data['summary'] = raw['summary']
 
-                async def extract_field(label):
-                    p = body and await body.query_selector(f"p:has-text('{label}')")
-                    if p:
-                        span = await p.query_selector('span')
-                        return await span.inner_text() if span else ''
-                    return ''
+                for key, val in raw['stats']:
+                    key_norm = key.strip().lower()
+                    if key_norm in STAT_MAP:
+                        data[STAT_MAP[key_norm]] = val
 
-                data['consumerLocation'] = await extract_field("Consumer Location")
-                data['vin'] = await extract_field("Vehicle Identification Number")
+                complaints[idx] = data
+                idx += 1
 
-                summary = await body.query_selector('p.vehicle-detail--issue-summary')
-                if summary:
-                    summary_p = await summary.evaluate_handle("el => el.nextElementSibling")
-                    data['summary'] = await summary_p.inner_text() if summary_p else ''
-                else:
-                    data['summary'] = ''
-
-                stats_col = await body.query_selector('.vehicle-details--complaints-sidebar')
-                if stats_col:
-                    stats = await stats_col.query_selector_all('p')
-                    for stat in stats:
-                        spans = await stat.query_selector_all('span')
-                        if len(spans) == 2:
-                            key = await spans[0].inner_text()
-                            val = await spans[1].inner_text()
-                            if key.lower() == 'crash':
-                                data['crash'] = val
-                            elif key.lower() == 'fire':
-                                data['fire'] = val
-                            elif 'injuries' in key.lower():
-                                data['injuries'] = val
-                            elif 'deaths' in key.lower():
-                                data['deaths'] = val
-
-                complaints.append(data)
-
-            except Exception as e:
-                print("Error parsing panel:", e)
+            except (KeyError, TypeError, IndexError) as e:
+                # a malformed panel is data noise, not a bug - skip it quietly
+                logger.debug("Skipping malformed panel: %s", e)
+
+        # quota filled - no point clicking through to the next page
+        if idx >= remaining:
+            return complaints
 
         # ✅ Pagination logic for complaints page
-        next_button = await page.query_selector("button.link-arrow:has-text('next')")
-        if next_button and await next_button.is_enabled():
-            await next_button.click()
-            await page.wait_for_timeout(1500)
+        if await page.evaluate(NEXT_CLICK_JS):
+            try:
+                # wait for the next page's requests to settle, not a fixed delay
+                await page.wait_for_load_state("networkidle", timeout=3000)
+            except PlaywrightTimeoutError:
+                # a straggling request can defeat networkidle even though
+                # the next page rendered - the button was clicked, so let
+                # the loop-top panel wait decide whether there's more data
+                pass
         else:
             break
 
-    return complaints
+    return complaints[:idx]
+
+
+async def fetch_vehicle_complaints(client, make, model):
+    """Fetch complaints for one make/model/year from the JSON API and map
+    them onto the same dict schema the browser extractor produces."""
+    resp = await client.get(
+        f"{NHTSA_API}/complaints/complaintsByVehicle",
+        params={"make": make, "model": model, "modelYear": YEAR},
+    )
+    resp.raise_for_status()
+    return [
+        {
+            "incidentDate": item.get("dateOfIncident") or "",
+            "nhtsaId": str(item.get("odiNumber") or ""),
+            "consumerLocation": item.get("consumerLocation") or "",
+            "vin": item.get("vin") or "",
+            "summary": item.get("summary") or "",
+            # the API serves these as JSON booleans; the sidebar shows
+            # Yes/No strings, so map them to keep one schema for both paths
+            "crash": "Yes" if item.get("crash") else "No",
+            "fire": "Yes" if item.get("fire") else "No",
+            "injuries": str(item.get("numberOfInjuries", "")),
+            "deaths": str(item.get("numberOfDeaths", "")),
+        }
+        for item in resp.json().get("results", [])
+    ]
+
+
+async def scrape_investigations_api():
+    """Pull complaints straight from api.nhtsa.gov - no browser, no
+    rendering, ~10 MB of RAM instead of a Chromium instance."""
+    collected = 0
+
+    limits = httpx.Limits(max_connections=32)
+    # Stream records out as NDJSON the moment they arrive: crash-safe
+    # partial output and no full result set held in memory
+    with open("nhtsa_complaints.ndjson", "ab") as out_f:
+        async with httpx.AsyncClient(http2=True, limits=limits, timeout=30.0) as client:
+            resp = await client.get(
+                f"{NHTSA_API}/products/vehicle/makes",
+                params={"modelYear": YEAR, "issueType": "c"},
+            )
+            resp.raise_for_status()
+            makes = [r["make"] for r in resp.json().get("results", [])]
+
+            for make in makes:
+                resp = await client.get(
+                    f"{NHTSA_API}/products/vehicle/models",
+                    params={"modelYear": YEAR, "make": make, "issueType": "c"},
+                )
+                resp.raise_for_status()
+                models = [r["model"] for r in resp.json().get("results", [])]
+
+                # fan out over every model of this make in one gather
+                batches = await asyncio.gather(
+                    *(fetch_vehicle_complaints(client, make, m) for m in models),
+                    return_exceptions=True,
+                )
+                for batch in batches:
+                    if isinstance(batch, Exception):
+                        print("Error fetching complaints:", batch)
+                        continue
+                    for data in batch:
+                        if collected >= MAX_COMPLAINTS:
+                            break
+                        out_f.write(orjson.dumps(data) + b"\n")
+                        collected += 1
+
+                if collected >= MAX_COMPLAINTS:
+                    break
+
+    print(f"\n✅ Streamed {collected} complaints to nhtsa_complaints.ndjson")
 
 
 async def scrape_investigations():
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False, slow_mo=200)
-        context = await browser.new_context()
+        # Persistent profile: HTTP cache, cookies and the V8 code cache
+        # survive across runs, so repeat runs skip re-downloading and
+        # re-JITting the NHTSA JS bundle
+        context = await p.chromium.launch_persistent_context(
+            user_data_dir=".playwright_profile",
+            headless=HEADLESS,
+            viewport={"width": 800, "height": 600},
+        )
+        # Bound worst-case latency: the library defaults are 30 s per wait,
+        # which serializes into minutes of dead time across empty row pages
+        context.set_default_timeout(5000)
+        context.set_default_navigation_timeout(NAV_TIMEOUT_MS)
+        await context.route(
+            "**/*",
+            lambda route: route.abort()
+            if route.request.resource_type in BLOCKED_RESOURCE_TYPES
+            else route.continue_(),
+        )
         page = await context.new_page()
 
         await page.goto("https://www.nhtsa.gov/recalls")
         await page.fill('#ymm-vin-recalls-search-input', YEAR)
         await page.keyboard.press('Enter')
-        await page.wait_for_timeout(2000)
-
-        all_complaints = []
-        MAX_COMPLAINTS = 20
-
-
-        while True:
-            print("Processing current page...")
-
-            await page.wait_for_selector("table")
-            rows = await page.query_selector_all("table > tbody > tr")
-
-            for row in rows:
-                links = await row.query_selector_all("td a")
-                if len(links) >= 2:
-                    investigation_link = await links[1].get_attribute("href")
-                    if investigation_link:
-                        full_url = "https://www.nhtsa.gov" + investigation_link
-                        print("Opening:", full_url)
-
-                        new_page = await context.new_page()
-                        await new_page.goto(full_url)
-                        await page.wait_for_timeout(100)
-                        await new_page.close()
-
-
-                    
-
-                        # # inside loop over result rows:
-                        # try:
-                        #     complaints = await extract_complaints_data(new_page, MAX_COMPLAINTS, len(all_complaints))
-                        #     all_complaints.extend(complaints)
-                        #     print(f"Total complaints collected: {len(all_complaints)}")
-                        # except Exception as e:
-                        #     print("Error scraping complaints:", e)
-
-                        # await new_page.close()
-
-                        # if len(all_complaints) >= MAX_COMPLAINTS:
-                        #     all_complaints = all_complaints[:MAX_COMPLAINTS]
-                        #     with open("nhtsa_complaints.json", "w") as f:
-                        #         json.dump(all_complaints, f, indent=2)
-                        #     print(f"\n✅ Saved {MAX_COMPLAINTS} complaints to nhtsa_complaints.json")
-                        #     await browser.close()
-                        #     return
-
-
-            # Handle pagination
-            next_button = await page.query_selector("button.link-arrow:has-text('next')")
-            if next_button and await next_button.is_enabled():
-                await next_button.click()
-                await page.wait_for_timeout(1000)
+        # wait for actual results rather than sleeping a fixed 2 s
+        await page.wait_for_selector(RESULTS_ROW_SEL, state="visible")
+
+        collected = 0
+        # Append-only NDJSON sink: records hit disk as they are extracted,
+        # so a crash loses nothing and memory stays flat at any quota
+        out_f = open("nhtsa_complaints.ndjson", "ab")
+        # Fixed pool of reusable pages: keeps the renderer (and its JIT'd
+        # code and caches) warm across navigations and bounds concurrency.
+        # Each page is recycled after RECYCLE_EVERY navigations to keep the
+        # renderer heap from growing unboundedly.
+        RECYCLE_EVERY = 50
+
+        page_pool = asyncio.Queue(maxsize=CONCURRENCY)
+        for _ in range(CONCURRENCY):
+            await page_pool.put([await context.new_page(), 0])
+
+        async def handle_row(row):
+            nonlocal collected
+            # quota may have been filled by a sibling while this task waited
+            if collected >= MAX_COMPLAINTS:
+                return
+            links = await row.query_selector_all(ROW_LINKS_SEL)
+            if len(links) < 2:
+                return
+            investigation_link = await links[1].get_attribute("href")
+            if not investigation_link:
+                return
+            full_url = "https://www.nhtsa.gov" + investigation_link
+            print("Opening:", full_url)
+            worker, navs = await page_pool.get()
+            try:
+                try:
+                    await worker.goto(full_url, wait_until="domcontentloaded", timeout=NAV_TIMEOUT_MS)
+                    complaints = await extract_complaints_data(worker, MAX_COMPLAINTS, collected)
+                except PlaywrightTimeoutError:
+                    # a slow detail page shouldn't take the whole run down
+                    logger.warning("Timed out on %s, skipping", full_url)
+                    return
+                # concurrent workers snapshot `collected` before extracting,
+                # so re-truncate against the live counter before writing to
+                # keep the global cap exact
+                complaints = complaints[:max(0, MAX_COMPLAINTS - collected)]
+                for data in complaints:
+                    out_f.write(orjson.dumps(data) + b"\n")
+                collected += len(complaints)
+                print(f"Total complaints collected: {collected}")
+            finally:
+                navs += 1
+                if navs >= RECYCLE_EVERY:
+                    await worker.close()
+                    worker, navs = await context.new_page(), 0
+                await page_pool.put([worker, navs])
+
+        # Every listing page is independently addressable via currentPage=N,
+        # so read the page count once and fan out instead of serially
+        # clicking "next" and re-waiting between pages
+        await page.wait_for_selector("table")
+        total_pages = await page.evaluate(PAGE_COUNT_JS)
+        base_url = page.url
+        print(f"Found {total_pages} listing page(s).")
+
+        # Bound open listing tabs: without this, every page >= 2 would open
+        # its own tab at once on top of the CONCURRENCY-sized row pool
+        listing_sem = asyncio.Semaphore(CONCURRENCY)
+
+        async def handle_listing_page(page_no):
+            async with listing_sem:
+                await _handle_listing_page(page_no)
+
+        async def _handle_listing_page(page_no):
+            if page_no == 1:
+                listing = page  # first page is already loaded
             else:
-                break
-
-        await browser.close()
-
-        # # Save whatever was collected (less than 10)
-        # with open("nhtsa_complaints.json", "w") as f:
-        #     json.dump(all_complaints[:10], f, indent=2)
-        # print("\n✅ Saved", len(all_complaints[:10]), "complaints to nhtsa_complaints.json")
-
-# Run it
-asyncio.run(scrape_investigations())
+                sep = "&" if "?" in base_url else "?"
+                listing = await context.new_page()
+                await listing.goto(f"{base_url}{sep}currentPage={page_no}", wait_until="domcontentloaded")
+                try:
+                    await listing.wait_for_selector(RESULTS_ROW_SEL, state="visible", timeout=3000)
+                except PlaywrightTimeoutError:
+                    # an empty listing page costs 3 s, not 30
+                    await listing.close()
+                    return
+            try:
+                rows = await listing.locator(ROW_SEL).element_handles()
+                # Overlap the per-row page loads; TaskGroup cancels the
+                # siblings if one worker hits a fatal (non-timeout) error
+                async with asyncio.TaskGroup() as tg:
+                    for row in rows:
+                        tg.create_task(handle_row(row))
+            finally:
+                if listing is not page:
+                    await listing.close()
+
+        async with asyncio.TaskGroup() as tg:
+            for n in range(1, total_pages + 1):
+                tg.create_task(handle_listing_page(n))
+
+        await context.close()
+        out_f.close()
+
+        print(f"\n✅ Streamed {collected} complaints to nhtsa_complaints.ndjson")
+
+# Run it (guarded so the module stays importable for testing/reuse)
+if __name__ == "__main__":
+    try:
+        # libuv-backed loop: fewer syscalls per CDP/WebSocket frame
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    if USE_BROWSER:
+        asyncio.run(scrape_investigations())
+    else:
+        asyncio.run(scrape_investigations_api())
@@ -0,0 +1,10 @@
+#!/usr/bin/env bash
+# Run Qdrant as a local server so clients can connect over gRPC
+# (QDRANT_URL=http://localhost:6334) instead of paying the embedded
+# client's single-process, cold-open cost on every run.
+set -euo pipefail
+
+docker run -d --name qdrant-nhtsa \
+    -p 6333:6333 -p 6334:6334 \
+    -v "$(pwd)/qdrant_nhtsa_db:/qdrant/storage" \
+    qdrant/qdrant